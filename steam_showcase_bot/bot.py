@@ -1,5 +1,9 @@
 import asyncio
+import atexit
 import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher
@@ -9,15 +13,20 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from .config import (
     FFMPEG_TERMINATE_TIMEOUT,
     FSM_STORAGE,
+    GIFS_DIR,
     HEARTBEAT_FILE,
     HEARTBEAT_INTERVAL_SECONDS,
+    IO_EXECUTOR_WORKERS,
     LOG_FILE,
+    LOG_FLUSH_INTERVAL_SECONDS,
     LOG_LEVEL,
     LOG_TO_FILE,
     MAX_CONCURRENT_TASKS,
+    PREPARED_DIR,
     RATE_LIMIT_SECONDS,
     REDIS_URL,
     SHUTDOWN_TASK_WAIT_TIMEOUT,
+    SLICED_DIR,
     TELEGRAM_CLIENT_CONNECT_LIMIT,
     TELEGRAM_CLIENT_TIMEOUT,
 )
@@ -33,15 +42,29 @@ from .services.processor import ProcessingService
 logger = logging.getLogger('steam_showcase_bot')
 numeric_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
 handlers = [logging.StreamHandler()]
+_file_log_buffer: MemoryHandler | None = None
 if LOG_TO_FILE:
     try:
         fh = logging.FileHandler(LOG_FILE, encoding='utf-8')
-        handlers.append(fh)
+        # INFO/DEBUG копятся в памяти и пишутся в файл пачкой, WARNING+ сбрасывают буфер сразу
+        _file_log_buffer = MemoryHandler(
+            capacity=1024,
+            flushLevel=logging.WARNING,
+            target=fh,
+            flushOnClose=True,
+        )
+        handlers.append(_file_log_buffer)
     except Exception:
         pass
+# Запись в stdout/файл выполняет фоновый поток QueueListener: в event loop
+# остаётся только форматирование записи и неблокирующий queue.put.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logging.basicConfig(
     level=numeric_level,
-    handlers=handlers,
+    handlers=[QueueHandler(_log_queue)],
     format='%(asctime)s %(levelname)s [%(name)s] %(message)s',
 )
 logger.setLevel(numeric_level)
@@ -90,13 +113,34 @@ async def _heartbeat_writer(stop_event: asyncio.Event) -> None:
             continue
 
 
+async def _log_buffer_flusher(stop_event: asyncio.Event) -> None:
+    """Периодически сбрасывает буфер файлового лога, ограничивая задержку записи."""
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=LOG_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        if _file_log_buffer is not None:
+            await loop.run_in_executor(None, _file_log_buffer.flush)
+
+
 async def on_startup() -> None:
-    """Создаёт aiohttp-сессию и семафор внутри event loop."""
+    """Создаёт рабочие директории, aiohttp-сессию и семафор внутри event loop."""
     global _custom_session
 
     if bot is None:
         return
 
+    for work_dir in (GIFS_DIR, PREPARED_DIR, SLICED_DIR):
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+    # Default executor обслуживает только короткий файловый I/O (aiofiles при скачивании,
+    # копирование в sliced_gifs, сброс лога); ffmpeg работает в своём пуле ниже.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(1, IO_EXECUTOR_WORKERS), thread_name_prefix='file-io')
+    )
+
     limit = TELEGRAM_CLIENT_CONNECT_LIMIT if TELEGRAM_CLIENT_CONNECT_LIMIT > 0 else 100
     session = AiohttpSession(
         timeout=float(TELEGRAM_CLIENT_TIMEOUT),
@@ -110,13 +154,24 @@ async def on_startup() -> None:
     )
 
     semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-    processor = ProcessingService(bot=bot, semaphore=semaphore)
+    ffmpeg_executor = ThreadPoolExecutor(
+        max_workers=max(1, MAX_CONCURRENT_TASKS),
+        thread_name_prefix='ffmpeg',
+    )
+    processor = ProcessingService(bot=bot, semaphore=semaphore, executor=ffmpeg_executor)
+    dp['ffmpeg_executor'] = ffmpeg_executor
     dp['processor'] = processor
     dp['is_stopping'] = False
     dp['active_processing_tasks'] = set()
+    # загрузки, прошедшие проверку MAX_PENDING_TASKS, но ещё не ставшие задачей
+    dp['reserved_processing_slots'] = 0
     stop_event = asyncio.Event()
     dp['heartbeat_stop_event'] = stop_event
     dp['heartbeat_task'] = asyncio.create_task(_heartbeat_writer(stop_event))
+    dp['log_flush_task'] = (
+        asyncio.create_task(_log_buffer_flusher(stop_event))
+        if _file_log_buffer is not None else None
+    )
     logger.info('ProcessingService ready (max_concurrent=%d)', MAX_CONCURRENT_TASKS)
 
 
@@ -140,6 +195,10 @@ async def on_shutdown() -> None:
     if terminated:
         logger.info('Stopped ffmpeg processes: terminated=%d, killed=%d', terminated, killed)
 
+    ffmpeg_executor = dp.workflow_data.get('ffmpeg_executor')
+    if isinstance(ffmpeg_executor, ThreadPoolExecutor):
+        ffmpeg_executor.shutdown(wait=False, cancel_futures=True)
+
     heartbeat_stop_event = dp.workflow_data.get('heartbeat_stop_event')
     heartbeat_task = dp.workflow_data.get('heartbeat_task')
     if isinstance(heartbeat_stop_event, asyncio.Event):
@@ -150,6 +209,13 @@ async def on_shutdown() -> None:
         except Exception:
             logger.exception('Error while stopping heartbeat task')
 
+    log_flush_task = dp.workflow_data.get('log_flush_task')
+    if isinstance(log_flush_task, asyncio.Task):
+        try:
+            await log_flush_task
+        except Exception:
+            logger.exception('Error while stopping log flush task')
+
     if _custom_session is not None:
         try:
             await _custom_session.close()
@@ -186,7 +252,13 @@ def main() -> None:
             if bot:
                 await bot.session.close()
 
-    asyncio.run(_run())
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(_run())
+    else:
+        logger.info('Using uvloop event loop')
+        uvloop.run(_run())
 
 
 if __name__ == '__main__':
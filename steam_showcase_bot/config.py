@@ -1,14 +1,22 @@
 import os
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Рабочие директории (создаются в on_startup)
+BASE_DIR = Path(__file__).resolve().parent
+GIFS_DIR = BASE_DIR / 'gifs'
+PREPARED_DIR = BASE_DIR / 'prepared_gifs'
+SLICED_DIR = BASE_DIR / 'sliced_gifs'
+
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
 LOG_FILE = os.getenv('LOG_FILE', 'steam_showcase_bot.log')
 LOG_TO_FILE = os.getenv('LOG_TO_FILE', '1') in ('1', 'true', 'True')
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('LOG_FLUSH_INTERVAL_SECONDS', '1'))
 
 SAVE_UPLOADS = os.getenv('SAVE_UPLOADS', '1') in ('1', 'true', 'True')
 
@@ -18,10 +26,18 @@ TELEGRAM_CLIENT_CONNECT_LIMIT = int(os.getenv('TELEGRAM_CLIENT_CONNECT_LIMIT', '
 MAX_ARCHIVE_SEND_MB = int(os.getenv('MAX_ARCHIVE_SEND_MB', '50'))
 ZIP_SEND_RETRIES = int(os.getenv('ZIP_SEND_RETRIES', '3'))
 ZIP_SEND_TIMEOUT = int(os.getenv('ZIP_SEND_TIMEOUT', '300'))
+ARCHIVE_CACHE_SIZE = int(os.getenv('ARCHIVE_CACHE_SIZE', '1024'))
 
 RATE_LIMIT_SECONDS = float(os.getenv('RATE_LIMIT_SECONDS', '30'))
 MAX_CONCURRENT_TASKS = int(os.getenv('MAX_CONCURRENT_TASKS', '3'))
+MAX_PENDING_TASKS = int(os.getenv('MAX_PENDING_TASKS', '20'))
+IO_EXECUTOR_WORKERS = int(os.getenv('IO_EXECUTOR_WORKERS', '8'))
 MAX_FILE_SIZE_MB = int(os.getenv('MAX_FILE_SIZE_MB', '20'))
+X264_PRESET = os.getenv('X264_PRESET', 'medium').strip() or 'medium'
+_SUPPORTED_HW_ENCODERS = {'auto', 'h264_nvenc', 'h264_qsv', 'h264_videotoolbox'}
+_hw_encoder_raw = os.getenv('FFMPEG_HW_ENCODER', '').strip().lower()
+FFMPEG_HW_ENCODER = _hw_encoder_raw if _hw_encoder_raw in _SUPPORTED_HW_ENCODERS else ''
+FFMPEG_HWACCEL = os.getenv('FFMPEG_HWACCEL', '0') in ('1', 'true', 'True')
 FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory').strip().lower()
 REDIS_URL = os.getenv('REDIS_URL', '').strip()
 _SUPPORTED_LOCALES = {'ru', 'en', 'uk'}
@@ -1,23 +1,197 @@
-import json
+import functools
 import logging
 import os
 import shutil
 import subprocess
 import threading
 import time
+import zipfile
+from collections.abc import Callable
 from pathlib import Path
 
+from .config import (
+    FFMPEG_HW_ENCODER,
+    FFMPEG_HWACCEL,
+    MAX_CONCURRENT_TASKS,
+    X264_PRESET,
+)
+
 logger = logging.getLogger('steam_showcase_bot.ffmpeg_utils')
 
-# detect ffmpeg binary: prefer FFMPEG_BIN env var, fallback to PATH lookup
-FFMPEG_BIN = os.environ.get('FFMPEG_BIN') or shutil.which('ffmpeg')
+
+@functools.lru_cache(maxsize=1)
+def ffmpeg_bin() -> str | None:
+    """Path to ffmpeg: FFMPEG_BIN env var, fallback to PATH lookup.
+
+    Resolved lazily on first use and cached, so importing the module does not walk PATH.
+    """
+    return os.environ.get('FFMPEG_BIN') or shutil.which('ffmpeg')
+
 
 _running_ffmpeg_processes: set[subprocess.Popen] = set()
 _ffmpeg_processes_lock = threading.Lock()
 
-def is_ffmpeg_available() -> bool:
-    """Return True if an ffmpeg executable is available (or FFMPEG_BIN set)."""
-    return bool(FFMPEG_BIN)
+# аппаратные H.264-энкодеры в порядке предпочтения и их настройки качества
+_HW_H264_ENCODER_ARGS = {
+    'h264_nvenc': ('-preset', 'p5', '-rc', 'vbr', '-cq', '20'),
+    'h264_qsv': ('-global_quality', '20'),
+    'h264_videotoolbox': ('-q:v', '55'),
+}
+# энкодеры, которые падали там, где libx264 справился (нет GPU/драйвера) — больше не пробуем
+_failed_hw_encoders: set[str] = set()
+
+# Неизменяемые части ffmpeg-команд собираются один раз при импорте;
+# в вызовах подставляются только бинарник, пути и настройки энкодера.
+# Бинарник сюда не входит: он определяется при первом вызове ffmpeg_bin().
+_FFMPEG_BASE_ARGS = ('-hide_banner', '-loglevel', 'error', '-y')
+_RESIZE_WIDTH = 750
+_RESIZE_FILTER_ARGS = ('-vf', f'scale={_RESIZE_WIDTH}:-2')
+# звук результату не нужен: 750px-файл идёт только в нарезку на GIF
+_RESIZE_OUTPUT_ARGS = ('-pix_fmt', 'yuv420p', '-an')
+# сколько последних строк stderr ffmpeg попадает в текст ошибки
+_FFMPEG_STDERR_TAIL_LINES = 20
+
+
+def is_ffmpeg_available(timeout: float = 10) -> bool:
+    """Return True if an ffmpeg executable is available and actually starts.
+
+    The `ffmpeg -version` probe is blocking: call this from an executor, not
+    from the event loop. Once a binary has started successfully, later calls
+    are a set lookup. timeout bounds the probe (seconds).
+    """
+    ffmpeg = ffmpeg_bin()
+    return bool(ffmpeg) and _ffmpeg_runs(ffmpeg, timeout)
+
+
+# Бинарники, успешно ответившие на -version. Кэшируется только успех: разовый
+# сбой или таймаут не должен навсегда отключать обработку до перезапуска.
+_working_ffmpeg_bins: set[str] = set()
+
+
+def _ffmpeg_runs(bin_path: str, timeout: float = 10) -> bool:
+    if bin_path in _working_ffmpeg_bins:
+        return True
+    try:
+        subprocess.run(
+            [bin_path, '-hide_banner', '-version'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=timeout,
+        )
+    except Exception as e:
+        logger.warning('ffmpeg binary %s is not usable: %s', bin_path, e)
+        return False
+    _working_ffmpeg_bins.add(bin_path)
+    return True
+
+
+# Список энкодеров по бинарнику. Как и для -version, кэшируется только удачный
+# запуск: разовый сбой не должен отключать аппаратное кодирование до перезапуска.
+_ffmpeg_encoders: dict[str, frozenset[str]] = {}
+
+
+def _list_ffmpeg_encoders(bin_path: str) -> frozenset[str]:
+    """Возвращает имена энкодеров из `ffmpeg -encoders` (один успешный запуск на бинарник)."""
+    cached = _ffmpeg_encoders.get(bin_path)
+    if cached is not None:
+        return cached
+    try:
+        result = subprocess.run(
+            [bin_path, '-hide_banner', '-encoders'],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=10,
+        )
+    except Exception:
+        logger.exception('Failed to list ffmpeg encoders')
+        return frozenset()
+
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # строки вида: " V....D h264_nvenc  NVIDIA NVENC H.264 encoder"
+        if len(parts) >= 2 and parts[0][:1] in ('V', 'A', 'S'):
+            names.add(parts[1])
+    encoders = _ffmpeg_encoders[bin_path] = frozenset(names)
+    return encoders
+
+
+def _detect_hw_encoder() -> str | None:
+    """Выбирает аппаратный H.264-энкодер согласно FFMPEG_HW_ENCODER или None."""
+    ffmpeg = ffmpeg_bin()
+    if not FFMPEG_HW_ENCODER or not ffmpeg:
+        return None
+    if FFMPEG_HW_ENCODER == 'auto':
+        candidates = tuple(_HW_H264_ENCODER_ARGS)
+    else:
+        candidates = (FFMPEG_HW_ENCODER,)
+    available = _list_ffmpeg_encoders(ffmpeg)
+    for name in candidates:
+        if name in available and name not in _failed_hw_encoders:
+            return name
+    return None
+
+
+def _threads_per_job(n: int) -> int:
+    """Сколько потоков дать одному ffmpeg, если одновременно работают n процессов.
+
+    По умолчанию каждый ffmpeg берёт потоки по числу ядер; при параллельных
+    задачах это даёт в разы больше потоков, чем ядер, и они вытесняют друг друга.
+    """
+    return max(1, (os.cpu_count() or n) // max(1, n))
+
+
+def _hwaccel_args() -> tuple[str, ...]:
+    """Аргументы аппаратного декодирования входа (FFMPEG_HWACCEL).
+
+    Кадры выгружаются в системную память, поэтому фильтры (scale, crop,
+    palettegen) работают как обычно; без устройства ffmpeg декодирует программно.
+    """
+    return ('-hwaccel', 'auto') if FFMPEG_HWACCEL else ()
+
+
+def _h264_encoder_args(encoder: str) -> list[str]:
+    """Аргументы видеокодека для ресайза: аппаратный энкодер или libx264."""
+    if encoder in _HW_H264_ENCODER_ARGS:
+        return ['-c:v', encoder, *_HW_H264_ENCODER_ARGS[encoder]]
+    return [
+        '-c:v', 'libx264',
+        '-preset', X264_PRESET,
+        '-tune', 'fastdecode',
+        '-crf', '20',
+    ]
+
+
+def _run_with_h264_fallback(build_cmd: Callable[[str], list[str]], what: str) -> None:
+    """Запустить команду с аппаратным H.264-энкодером, а при ошибке — с libx264.
+
+    build_cmd получает имя энкодера и возвращает команду ffmpeg. Аппаратный
+    энкодер отключается до конца процесса, только если libx264 на том же входе
+    справился: иначе виноват сам файл, а не энкодер.
+    """
+    hw_encoder = _detect_hw_encoder()
+    encoders = [hw_encoder, 'libx264'] if hw_encoder else ['libx264']
+
+    failed_hw = None
+    for encoder in encoders:
+        cmd = build_cmd(encoder)
+        # join строки с длинным filter_complex не нужен, если DEBUG выключен
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Running ffmpeg for %s: %s', what, ' '.join(cmd))
+        try:
+            _run_ffmpeg_command(cmd)
+        except RuntimeError:
+            if encoder == 'libx264':
+                raise
+            failed_hw = encoder
+            logger.warning('Hardware encoder %s failed, retrying with libx264', encoder)
+            continue
+        if failed_hw:
+            _failed_hw_encoders.add(failed_hw)
+            logger.warning('Hardware encoder %s disabled: libx264 succeeded on the same input', failed_hw)
+        return
 
 
 def _track_ffmpeg_process(proc: subprocess.Popen) -> None:
@@ -30,17 +204,19 @@ def _untrack_ffmpeg_process(proc: subprocess.Popen) -> None:
         _running_ffmpeg_processes.discard(proc)
 
 
-def _run_ffmpeg_command(cmd: list[str], capture_output: bool = False) -> tuple[str, str] | None:
-    """Запускает ffmpeg-команду с трекингом процесса для graceful shutdown."""
-    stdout_pipe = subprocess.PIPE if capture_output else None
-    stderr_pipe = subprocess.PIPE if capture_output else None
+def _run_ffmpeg_command(cmd: list[str]) -> None:
+    """Запускает ffmpeg-команду с трекингом процесса для graceful shutdown.
 
+    stdout ffmpeg не использует и уходит в DEVNULL. stderr читается как байты
+    и декодируется только при ошибке — для текста исключения. communicate()
+    вычитывает pipe по ходу работы, так что ffmpeg не блокируется на записи;
+    в ошибку попадают только последние строки stderr.
+    """
     try:
         proc = subprocess.Popen(
             cmd,
-            stdout=stdout_pipe,
-            stderr=stderr_pipe,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
         )
     except FileNotFoundError as e:
         logger.error('ffmpeg executable not found: %s', e)
@@ -51,19 +227,16 @@ def _run_ffmpeg_command(cmd: list[str], capture_output: bool = False) -> tuple[s
 
     _track_ffmpeg_process(proc)
     try:
-        out, err = proc.communicate()
+        _, err = proc.communicate()
     finally:
         _untrack_ffmpeg_process(proc)
 
     if proc.returncode != 0:
-        error_text = err if err else f'код возврата {proc.returncode}'
+        lines = err.decode('utf-8', 'replace').strip().splitlines() if err else []
+        error_text = '\n'.join(lines[-_FFMPEG_STDERR_TAIL_LINES:]) or f'код возврата {proc.returncode}'
         logger.error('ffmpeg failed: %s', error_text)
         raise RuntimeError(f'ffmpeg error:\n{error_text}')
 
-    if capture_output:
-        return out, err
-    return None
-
 
 def terminate_running_ffmpeg_processes(grace_timeout: float = 5.0) -> tuple[int, int]:
     """Мягко завершает активные ffmpeg-процессы, затем принудительно убивает зависшие.
@@ -105,12 +278,46 @@ def terminate_running_ffmpeg_processes(grace_timeout: float = 5.0) -> tuple[int,
     return terminated_count, killed_count
 
 
-def resize_mp4_to_width_750(input_path: Path, output_path: Path) -> None:
+def move_file(src_path: Path, dest: Path) -> None:
+    """Переместить src_path в dest: os.replace на одной ФС, иначе копирование и удаление исходника."""
+    try:
+        os.replace(src_path, dest)
+    except OSError:
+        shutil.copy2(src_path, dest)
+        os.unlink(src_path)
+
+
+def _prefetch_input(path: Path) -> None:
+    """Попросить ядро заранее подтянуть файл в page cache (POSIX_FADV_WILLNEED).
+
+    Файл мог долго ждать семафор в очереди и уйти из кэша. Подсказка SEQUENTIAL
+    здесь бесполезна: она привязана к открытому дескриптору, а файл читает
+    отдельный процесс ffmpeg. WILLNEED же запускает readahead для самого файла.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def resize_mp4_to_width_750(input_path: Path, output_path: Path) -> int:
     """
     Приводит ширину видео к 750px (включая апскейл, если исходная ширина меньше),
-    не кропает, сохраняет пропорции, качество высокое (H.264, CRF 18).
+    не кропает, сохраняет пропорции (H.264, CRF 20, пресет X264_PRESET).
+    Результат — промежуточный файл для нарезки, поэтому вместо slow используется
+    более быстрый пресет и -tune fastdecode. Если задан FFMPEG_HW_ENCODER и энкодер
+    доступен, кодирует на GPU, а при ошибке повторяет через libx264.
 
-    input_path/output_path могут быть str или Path. Функция бросает
+    input_path/output_path могут быть str или Path. Возвращает итоговую ширину
+    (750), чтобы нарезка не перепроверяла её через ffprobe. Функция бросает
     RuntimeError при ошибке ffmpeg или если ffmpeg не найден.
     """
     if not is_ffmpeg_available():
@@ -119,51 +326,41 @@ def resize_mp4_to_width_750(input_path: Path, output_path: Path) -> None:
     input_str = str(Path(input_path))
     output_str = str(Path(output_path))
 
-    cmd = [
-        FFMPEG_BIN,
-        "-y",  # перезаписывать выходной файл
-        "-i", input_str,
-        "-vf", "scale=750:-2",
-        "-c:v", "libx264",
-        "-preset", "slow",
-        "-crf", "18",
-        "-pix_fmt", "yuv420p",
-        "-c:a", "copy",
-    ]
-
-    # добавляем выход в конце
-    cmd.append(output_str)
+    # одновременно идут до MAX_CONCURRENT_TASKS ресайзов
+    threads = str(_threads_per_job(MAX_CONCURRENT_TASKS))
+    _prefetch_input(Path(input_path))
+
+    def _build_cmd(encoder: str) -> list[str]:
+        return [
+            ffmpeg_bin(), *_FFMPEG_BASE_ARGS, *_hwaccel_args(), "-threads", threads, "-i", input_str,
+            *_RESIZE_FILTER_ARGS,
+            *_h264_encoder_args(encoder),
+            *_RESIZE_OUTPUT_ARGS,
+            "-threads", threads,
+            output_str,
+        ]
 
-    logger.debug('Running ffmpeg command: %s', ' '.join(cmd))
-    _run_ffmpeg_command(cmd, capture_output=True)
+    _run_with_h264_fallback(_build_cmd, 'resize')
+    return _RESIZE_WIDTH
 
 
-def prepare_and_resize_copy(src_path: Path, prepared_dir: Path) -> Path:
+def prepare_and_resize_copy(src_path: Path, prepared_dir: Path) -> tuple[Path, int]:
     """
-    Скопировать src_path в prepared_dir, затем выполнить resize
-    и заменить скопированный файл результатом обработки.
+    Выполнить resize mp4-файла src_path в prepared_dir. Исходник не копируется:
+    ffmpeg читает его напрямую, результат переименовывается в dest.
+    Другие форматы отсекает вызывающий код (ProcessingService) до этого шага.
 
-    Возвращает путь к подготовленному (обработанному) файлу.
+    Возвращает (путь к подготовленному файлу, ширина после resize).
     """
     prepared_dir.mkdir(parents=True, exist_ok=True)
     dest = prepared_dir / src_path.name
 
-    # copy original into prepared dir
-    shutil.copy2(src_path, dest)
-    logger.info('Copied %s -> %s', src_path, dest)
-
-    # only process mp4 files
-    if dest.suffix.lower() != '.mp4':
-        logger.info('Skipping ffmpeg resize for non-mp4 file: %s', dest)
-        return dest
-
     tmp_out = dest.with_name(dest.stem + '_750w' + dest.suffix)
     try:
-        resize_mp4_to_width_750(dest, tmp_out)
-        # replace original copied file with resized output
+        width = resize_mp4_to_width_750(src_path, tmp_out)
         tmp_out.replace(dest)
         logger.info('Resized and replaced %s', dest)
-        return dest
+        return dest, width
     except Exception:
         # on failure, attempt to remove tmp_out if exists
         try:
@@ -173,14 +370,23 @@ def prepare_and_resize_copy(src_path: Path, prepared_dir: Path) -> Path:
             pass
         raise
 
-# --- Additional utilities: probe, gif creation, and slicing into parts ---
 
-# detect ffprobe binary similarly to ffmpeg
-FFPROBE_BIN = os.environ.get('FFPROBE_BIN') or shutil.which('ffprobe') or (os.path.join(os.path.dirname(FFMPEG_BIN), 'ffprobe') if FFMPEG_BIN and os.path.dirname(FFMPEG_BIN) else None)
+# --- Additional utilities: probe and slicing into GIF parts ---
+
+@functools.lru_cache(maxsize=1)
+def ffprobe_bin() -> str | None:
+    """Path to ffprobe, detected similarly to ffmpeg (plus a lookup next to the ffmpeg binary)."""
+    ffmpeg = ffmpeg_bin()
+    return (
+        os.environ.get('FFPROBE_BIN')
+        or shutil.which('ffprobe')
+        or (os.path.join(os.path.dirname(ffmpeg), 'ffprobe') if ffmpeg and os.path.dirname(ffmpeg) else None)
+    )
+
 
 def is_ffprobe_available() -> bool:
     """Return True if ffprobe is available."""
-    return bool(FFPROBE_BIN)
+    return bool(ffprobe_bin())
 
 
 def get_width_height(path: Path):
@@ -188,146 +394,163 @@ def get_width_height(path: Path):
     if not is_ffprobe_available():
         raise RuntimeError("ffprobe не найден: установите ffprobe и добавьте его в PATH или задайте переменную окружения FFPROBE_BIN.")
     cmd = [
-        FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+        ffprobe_bin(), "-v", "error", "-select_streams", "v:0",
         "-show_entries", "stream=width,height",
-        "-of", "json", str(path)
+        "-of", "csv=p=0", str(path)
     ]
     try:
-        out = subprocess.check_output(cmd, text=True)
-        data = json.loads(out)
-        w = data["streams"][0]["width"]
-        h = data["streams"][0]["height"]
+        # csv без префикса секции даёт одну строку вида "750,420"
+        proc = subprocess.run(cmd, capture_output=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode('utf-8', errors='replace').strip() or f'exit code {proc.returncode}')
+        w, h = map(int, proc.stdout.decode('ascii').strip().split(','))
         return w, h
     except Exception as e:
         logger.error('ffprobe failed: %s', e)
         raise RuntimeError(f"ffprobe error: {e}") from e
 
 
-def make_gif_from_video(input_path: Path, output_gif: Path, fps: int = 12, scale_w: int = -1, max_colors: int = 128):
-    """Create an optimized GIF from a video using ffmpeg.
+def _fix_gif_terminator(gif_path: Path, sync: bool = False) -> bool:
+    """If last byte of GIF is 0x3B, replace it with 0x21. Returns True if changed.
 
-    To keep generated GIF sizes reasonable (targeting ~<=5MB per GIF), we use a
-    moderate fps, limit palette colors, and apply a mild dither. If scale_w is -1,
-    the input width is preserved; otherwise the GIF width is set to `scale_w`.
+    The byte is read and written with pread/pwrite at a known offset (no seeks;
+    lseek fallback where pread is unavailable, e.g. Windows). fsync is only done
+    with sync=True: the GIFs are zipped right away, so a storage barrier per file
+    buys nothing.
     """
-    if not is_ffmpeg_available():
-        raise RuntimeError("ffmpeg не найден: установите ffmpeg и добавьте его в PATH или задайте переменную окружения FFMPEG_BIN.")
-    # build filter chain with controlled palette size and dither to reduce GIF size
-    vf = f"fps={fps},scale={scale_w}:-1:flags=lanczos,split[s0][s1];[s0]palettegen=max_colors={max_colors}[p];[s1][p]paletteuse=dither=bayer"
-    cmd = [
-        FFMPEG_BIN, "-y", "-i", str(input_path),
-        "-vf", vf,
-        str(output_gif)
-    ]
-    logger.debug('Running ffmpeg for GIF: %s', ' '.join(cmd))
-    _run_ffmpeg_command(cmd)
-
-    # После создания GIF проверяем последний байт и при необходимости заменяем 0x3B на 0x21
-    try:
-        _fix_gif_terminator(output_gif)
-    except Exception:
-        logger.exception('Failed to adjust GIF terminator for %s', output_gif)
-
-def _fix_gif_terminator(gif_path: Path) -> bool:
-    """If last byte of GIF is 0x3B, replace it with 0x21. Returns True if changed."""
     p = Path(gif_path)
     try:
-        with p.open('r+b') as f:
-            f.seek(0, os.SEEK_END)
-            size = f.tell()
+        fd = os.open(p, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            size = os.fstat(fd).st_size
             if size == 0:
                 logger.debug('GIF file %s is empty, skipping terminator fix', p)
                 return False
             # read last byte
-            f.seek(-1, os.SEEK_END)
-            last = f.read(1)
+            if hasattr(os, 'pread'):
+                last = os.pread(fd, 1, size - 1)
+            else:
+                os.lseek(fd, size - 1, os.SEEK_SET)
+                last = os.read(fd, 1)
             if last == b'\x3B':
-                f.seek(-1, os.SEEK_END)
-                f.write(b'\x21')
-                f.flush()
-                try:
-                    os.fsync(f.fileno())
-                except Exception:
-                    pass
+                if hasattr(os, 'pwrite'):
+                    os.pwrite(fd, b'\x21', size - 1)
+                else:
+                    os.lseek(fd, size - 1, os.SEEK_SET)
+                    os.write(fd, b'\x21')
+                if sync:
+                    os.fsync(fd)
                 logger.info('Replaced GIF terminator for %s: 0x3B -> 0x21', p)
                 return True
             else:
                 logger.debug('GIF terminator is %s for %s; no change', last.hex() if last else None, p)
                 return False
+        finally:
+            os.close(fd)
     except Exception as e:
         logger.exception('Error adjusting GIF terminator for %s: %s', gif_path, e)
         raise
 
 
-def slice_video_inplace_with_gifs(path: str | Path):
-    """Slice a 750px-wide video into five 150px-wide parts.
+def _remove_gif_dir(gif_dir: Path, gif_paths: list[Path]) -> None:
+    """Удалить известные GIF-файлы и их директорию без обхода дерева через rmtree."""
+    for gif_path in gif_paths:
+        gif_path.unlink(missing_ok=True)
+    gif_dir.rmdir()
+
 
-    Replaces the original file with the first part (inplace), writes parts 2..5 as separate files
-    next to the input, and creates a directory <stem>_gifs with part1.gif..part5.gif.
+def slice_video_inplace_with_gifs(
+    path: str | Path, known_width: int | None = None,
+) -> tuple[Path, list[Path]]:
+    """Slice a 750px-wide video into five 150px-wide GIFs.
+
+    part1.gif..part5.gif are encoded straight from the input and packed into
+    <stem>_gifs.zip next to it; no intermediate mp4 parts are written. The input
+    file itself is left untouched.
+
+    Returns (archive_path, artifacts): archive_path is the ZIP with GIFs, artifacts are the
+    files the caller should remove once the archive is sent (the 750px input). On failure the
+    GIFs, palette and partial archive created so far are removed before the exception propagates.
+
+    known_width is the width reported by the resize step; ffprobe is only run when it is None.
     """
+    if not is_ffmpeg_available():
+        raise RuntimeError("ffmpeg не найден: установите ffmpeg и добавьте его в PATH или задайте переменную окружения FFMPEG_BIN.")
     p = Path(path)
-    w, h = get_width_height(p)
+    w = known_width if known_width is not None else get_width_height(p)[0]
     if w != 750:
         raise ValueError(f"Ожидалась ширина 750px, получено {w}px")
 
     part_w = 150
+    gif_fps = 12
+    gif_colors = 128
 
-    # Temporary file for the first part so we can replace the original safely
-    tmp_first = p.with_name(f"{p.stem}__tmp_part1{p.suffix}")
+    gif_dir = p.with_name(f"{p.stem}_gifs")
+    gif_paths = [gif_dir / f"part{i}.gif" for i in range(1, 6)]
+    palette = p.with_name(f"{p.stem}_palette.png")
+    archive_path = p.with_name(f"{p.stem}_gifs.zip")
 
-    part_paths = []
+    # одновременно идут до MAX_CONCURRENT_TASKS нарезок, по одному ffmpeg на каждую
+    threads = str(_threads_per_job(MAX_CONCURRENT_TASKS))
+    input_args = (*_FFMPEG_BASE_ARGS, *_hwaccel_args(), "-threads", threads, "-i", str(p))
 
-    # Нарезка на 5 частей
-    for i in range(5):
-        x = i * part_w
-        out = tmp_first if i == 0 else p.with_name(f"{p.stem}_part{i+1}{p.suffix}")
+    try:
+        # Проход 1: общая палитра по всему 750px-кадру — все слоты Витрины получают
+        # одинаковые цвета. stats_mode=diff: палитра строится по меняющимся пикселям,
+        # статичный фон не съедает цвета. Отдельный проход нужен ради памяти: в одном
+        # графе paletteuse ждал бы палитру до конца видео, буферизуя все кадры.
+        _run_ffmpeg_command([
+            ffmpeg_bin(), *input_args,
+            "-vf", f"fps={gif_fps},palettegen=max_colors={gif_colors}:stats_mode=diff", "-filter_threads", threads,
+            "-frames:v", "1", "-update", "1", str(palette),
+        ])
+
+        # Проход 2: вход декодируется один раз, split раздаёт кадры пяти crop-ветвям,
+        # и каждая сразу кодируется в GIF с общей палитрой — без промежуточных mp4.
+        labels = range(5)
+        graph = [
+            f"[0:v]fps={gif_fps},split=5{''.join(f'[s{i}]' for i in labels)}",
+            f"[1:v]split=5{''.join(f'[p{i}]' for i in labels)}",
+        ]
+        graph += [
+            f"[s{i}]crop={part_w}:ih:{i * part_w}:0[c{i}];[c{i}][p{i}]paletteuse=dither=bayer:bayer_scale=5[g{i}]"
+            for i in labels
+        ]
+        gif_dir.mkdir(exist_ok=True)
+        # -filter_threads действует только на -vf; для графа -filter_complex свой параметр
         cmd = [
-            FFMPEG_BIN, "-y", "-i", str(p),
-            "-vf", f"crop={part_w}:{h}:{x}:0",
-            "-c:v", "libx264", "-crf", "18", "-preset", "medium",
-            "-c:a", "copy",
-            str(out)
+            ffmpeg_bin(), *input_args, "-i", str(palette),
+            "-filter_complex_threads", threads, "-filter_complex", ";".join(graph),
         ]
-        logger.debug('Running ffmpeg for slice: %s', ' '.join(cmd))
+        for i, gif_path in zip(labels, gif_paths):
+            cmd += ["-map", f"[g{i}]", str(gif_path)]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Running ffmpeg for GIFs: %s', ' '.join(cmd))
         _run_ffmpeg_command(cmd)
-        part_paths.append(out)
 
-    # Перезаписываем исходник первой частью
-    tmp_first.replace(p)
-    part_paths[0] = p  # обновляем путь первой части
-
-    # Создаём директорию для GIF
-    gif_dir = p.with_name(f"{p.stem}_gifs")
-    gif_dir.mkdir(exist_ok=True)
-
-    # Делаем 5 GIF-ов — используем мягкий апскейл и лимиты, чтобы GIFы были компактнее (~<=5MB)
-    for i, part in enumerate(part_paths, start=1):
-        gif_path = gif_dir / f"part{i}.gif"
-        logger.info('Creating GIF %s from %s', gif_path, part)
-        # Each sliced part is 150px wide; ensure GIF stays compact by forcing 150px width,
-        # using slightly lower fps and reduced palette size.
-        make_gif_from_video(part, gif_path, fps=12, scale_w=150, max_colors=128)
-        try:
-            size_kb = gif_path.stat().st_size / 1024
-            logger.info('Created GIF %s (%.1f KB)', gif_path, size_kb)
-        except Exception:
-            logger.exception('Failed to stat GIF %s after creation', gif_path)
-
-    logger.info('Slicing complete. GIFs are in %s', gif_dir)
-
-    # Archive the GIFs into a ZIP file placed next to the sliced files (in sliced_gifs/),
-    # then remove the intermediate GIF files to save space.
-    try:
-        zip_base = str(p.with_name(f"{p.stem}_gifs"))  # without .zip suffix
-        archive_path = shutil.make_archive(zip_base, 'zip', root_dir=str(gif_dir))
-        logger.info('Created ZIP archive of GIFs at %s', archive_path)
-        try:
-            shutil.rmtree(gif_dir)
-            logger.info('Removed intermediate GIF directory %s after archiving', gif_dir)
-        except Exception:
-            logger.exception('Failed to remove GIF directory %s after archiving', gif_dir)
-        # Return the path to archive for potential callers
-        return Path(archive_path)
+        # Готовые GIF по очереди правятся, дописываются в ZIP (в порядке part1..part5)
+        # и удаляются. GIF уже сжат LZW, поэтому записи хранятся без deflate.
+        with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for gif_path in gif_paths:
+                _fix_gif_terminator(gif_path)
+                logger.info('Created GIF %s (%.1f KB)', gif_path, gif_path.stat().st_size / 1024)
+                zf.write(gif_path, arcname=gif_path.name)
+                gif_path.unlink()
+        gif_dir.rmdir()
     except Exception:
-        logger.exception('Failed to create ZIP archive for GIFs in %s; leaving GIF files in place', gif_dir)
-        return None
\ No newline at end of file
+        # Убираем только то, что создала эта нарезка; исходник p удаляет вызывающий код
+        for leftover in (palette, archive_path):
+            try:
+                leftover.unlink(missing_ok=True)
+            except Exception:
+                logger.exception('Failed to remove partial slice %s', leftover)
+        if gif_dir.exists():
+            try:
+                _remove_gif_dir(gif_dir, gif_paths)
+            except OSError:
+                logger.exception('Failed to remove partial GIF directory %s', gif_dir)
+        raise
+
+    palette.unlink(missing_ok=True)
+    logger.info('Slicing complete. GIFs are archived in %s', archive_path)
+    return archive_path, [p]
@@ -14,13 +14,8 @@ router = Router(name='callbacks')
 async def handle_callback(callback: types.CallbackQuery, bot: Bot, dispatcher: Dispatcher):
     """Обрабатывает нажатия на инлайн-кнопки."""
     data = callback.data
-    user = getattr(callback, 'from_user', None)
-    locale = await get_user_locale(
-        dispatcher,
-        bot,
-        getattr(user, 'id', None),
-        getattr(user, 'language_code', None),
-    )
+    user = callback.from_user
+    locale = await get_user_locale(dispatcher, bot, user.id, user.language_code)
     try:
         if data == 'help':
             await callback.message.answer(help_text(locale), parse_mode='HTML')
@@ -37,13 +32,8 @@ async def handle_callback(callback: types.CallbackQuery, bot: Bot, dispatcher: D
 
 @router.callback_query(F.data == 'choose_language')
 async def handle_choose_language(callback: types.CallbackQuery, bot: Bot, dispatcher: Dispatcher):
-    user = getattr(callback, 'from_user', None)
-    locale = await get_user_locale(
-        dispatcher,
-        bot,
-        getattr(user, 'id', None),
-        getattr(user, 'language_code', None),
-    )
+    user = callback.from_user
+    locale = await get_user_locale(dispatcher, bot, user.id, user.language_code)
     try:
         if callback.message is not None:
             await callback.message.answer(
@@ -62,9 +52,8 @@ async def handle_choose_language(callback: types.CallbackQuery, bot: Bot, dispat
 
 @router.callback_query(F.data.startswith('set_lang:'))
 async def handle_set_language(callback: types.CallbackQuery, bot: Bot, dispatcher: Dispatcher):
-    user = getattr(callback, 'from_user', None)
-    user_id = getattr(user, 'id', None)
-    tg_locale = getattr(user, 'language_code', None)
+    user_id = callback.from_user.id
+    tg_locale = callback.from_user.language_code
     selected = (callback.data or '').split(':', 1)[1]
     locale = await set_user_locale(dispatcher, bot, user_id, selected)
     try:
@@ -13,13 +13,13 @@ router = Router(name='commands')
 
 @router.message(Command('start'))
 async def cmd_start(message: types.Message, bot: Bot, dispatcher: Dispatcher):
-    logger.info('cmd_start: from=%s', getattr(getattr(message, 'from_user', None), 'id', None))
-    user = getattr(message, 'from_user', None)
-    user_id = getattr(user, 'id', None)
-    tg_locale = getattr(user, 'language_code', None)
+    user = message.from_user
+    user_id = user.id if user else None
+    logger.info('cmd_start: from=%s', user_id)
+    tg_locale = user.language_code if user else None
     locale = await get_user_locale(dispatcher, bot, user_id, tg_locale)
     locale = await set_user_locale(dispatcher, bot, user_id, locale)
-    first_name = getattr(getattr(message, 'from_user', None), 'first_name', None) or 'друг'
+    first_name = (user.first_name if user else None) or 'друг'
     await message.answer(
         welcome_text(first_name, locale),
         parse_mode='HTML',
@@ -29,13 +29,13 @@ async def cmd_start(message: types.Message, bot: Bot, dispatcher: Dispatcher):
 
 @router.message(Command('help'))
 async def cmd_help(message: types.Message, bot: Bot, dispatcher: Dispatcher):
-    logger.info('cmd_help: from=%s', getattr(getattr(message, 'from_user', None), 'id', None))
-    user = getattr(message, 'from_user', None)
+    user = message.from_user
+    logger.info('cmd_help: from=%s', user.id if user else None)
     locale = await get_user_locale(
         dispatcher,
         bot,
-        getattr(user, 'id', None),
-        getattr(user, 'language_code', None),
+        user.id if user else None,
+        user.language_code if user else None,
     )
     await message.answer(help_text(locale), parse_mode='HTML')
 
@@ -43,13 +43,13 @@ async def cmd_help(message: types.Message, bot: Bot, dispatcher: Dispatcher):
 @router.message(Command('lang'))
 @router.message(Command('language'))
 async def cmd_lang(message: types.Message, bot: Bot, dispatcher: Dispatcher):
-    logger.info('cmd_lang: from=%s', getattr(getattr(message, 'from_user', None), 'id', None))
-    user = getattr(message, 'from_user', None)
+    user = message.from_user
+    logger.info('cmd_lang: from=%s', user.id if user else None)
     locale = await get_user_locale(
         dispatcher,
         bot,
-        getattr(user, 'id', None),
-        getattr(user, 'language_code', None),
+        user.id if user else None,
+        user.language_code if user else None,
     )
     await message.answer(
         tr('language_choose_title', locale),
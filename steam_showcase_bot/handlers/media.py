@@ -1,11 +1,12 @@
 import asyncio
-import datetime
+import itertools
 import logging
-from pathlib import Path
+import time
+from collections.abc import Callable
 
-from aiogram import Bot, Dispatcher, Router, types
+from aiogram import Bot, Dispatcher, F, Router, types
 
-from ..config import MAX_FILE_SIZE_MB
+from ..config import GIFS_DIR, MAX_FILE_SIZE_MB, MAX_PENDING_TASKS
 from ..i18n import get_user_locale, tr
 from ..services.processor import ProcessingService
 from ..texts import edit_status, esc
@@ -14,23 +15,19 @@ logger = logging.getLogger('steam_showcase_bot.handlers.media')
 
 router = Router(name='media')
 
+# bot.download() уже пишет файл потоково через aiofiles; крупный чанк уменьшает
+# число переходов в executor на каждую запись (64 KB по умолчанию в aiogram)
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
 
-def _is_media(message: types.Message) -> bool:
-    has_animation = bool(getattr(message, 'animation', None))
-    has_document = bool(message.document)
-    has_video = bool(getattr(message, 'video', None))
-    result = has_animation or has_document or has_video
-    if result:
-        logger.debug(
-            'Media filter matched: animation=%s document=%s video=%s',
-            has_animation, has_document, has_video,
-        )
-    return result
+_TS_FMT = '%Y%m%d_%H%M%S'
+# Счётчик загрузок за время жизни процесса: гарантирует уникальность имени
+# даже для нескольких файлов одного пользователя в одну и ту же секунду
+_UPLOAD_COUNTER = itertools.count()
 
 
 def _check_file_size(file_obj) -> tuple[bool, float | None]:
     """Возвращает (ok, size_mb). ok=False если файл превышает лимит."""
-    file_size = getattr(file_obj, 'file_size', None)
+    file_size = file_obj.file_size
     if file_size is None:
         return True, None
     size_mb = file_size / (1024 * 1024)
@@ -39,30 +36,49 @@ def _check_file_size(file_obj) -> tuple[bool, float | None]:
     return True, size_mb
 
 
-@router.message(_is_media)
-async def handle_file(message: types.Message, bot: Bot, processor: ProcessingService, dispatcher: Dispatcher):
-    """Скачивает GIF/видео, создаёт прогресс-сообщение и запускает обработку."""
-    gifs_dir = Path(__file__).resolve().parent.parent / 'gifs'
-    gifs_dir.mkdir(exist_ok=True)
-
-    user = getattr(message, 'from_user', None)
-    user_id = getattr(user, 'id', None)
+def _pick_media(message: types.Message):
+    """Возвращает (file_obj, имя файла) первого вложения: анимация, видео, документ.
+
+    Порядок важен: у GIF-анимаций Telegram заполняет и animation, и document.
+    """
+    if message.animation:
+        return message.animation, message.animation.file_name or 'animation.mp4'
+    if message.video:
+        return message.video, message.video.file_name or 'video.mp4'
+    if message.document:
+        return message.document, message.document.file_name or 'file'
+    return None, None
+
+
+@router.message(F.animation | F.video | F.document)
+async def handle_file(
+    message: types.Message,
+    bot: Bot,
+    processor: ProcessingService,
+    dispatcher: Dispatcher,
+    release_throttle: Callable[[], None] | None = None,
+):
+    """Скачивает GIF/видео, создаёт прогресс-сообщение и запускает обработку.
+
+    release_throttle передаёт ThrottlingMiddleware: вызывается, когда файл отклонён
+    из-за очереди, чтобы пользователь мог повторить отправку, не дожидаясь лимита.
+    """
+    user = message.from_user
+    user_id = user.id if user else None
     locale = await get_user_locale(
         dispatcher,
         bot,
         user_id,
-        getattr(user, 'language_code', None),
+        user.language_code if user else None,
     )
     owner_id = user_id if user_id is not None else 'unknown'
-    ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    ts = f'{time.strftime(_TS_FMT)}_{next(_UPLOAD_COUNTER)}'
 
-    anim = getattr(message, 'animation', None)
-    doc = message.document
-    vid = getattr(message, 'video', None)
+    file_obj, fname = _pick_media(message)
 
     logger.info(
-        'handle_file: msg_id=%s from=%s anim=%s doc=%s video=%s',
-        message.message_id, user_id, bool(anim), bool(doc), bool(vid),
+        'handle_file: msg_id=%s from=%s media=%s',
+        message.message_id, user_id, type(file_obj).__name__ if file_obj else None,
     )
 
     async def _download_and_process(file_obj, fname: str):
@@ -86,37 +102,75 @@ async def handle_file(message: types.Message, bot: Bot, processor: ProcessingSer
             )
             return
 
-        dest = gifs_dir / f'{owner_id}_{ts}_{fname}'
-        status_msg = await message.answer(tr('media_downloading', locale), parse_mode='HTML')
-        await bot.download(file_obj.file_id, destination=dest)
-        logger.info('Downloaded to %s (%d bytes)', dest, dest.stat().st_size)
+        if await processor.send_cached_archive(file_obj.file_unique_id, message, locale):
+            return
+
+        # Backpressure: задачи сверх MAX_CONCURRENT_TASKS ждут семафор, держа скачанный
+        # файл на диске. Когда очередь уже длинная, не скачиваем новый файл вовсе.
+        # Место в очереди резервируется до скачивания и переходит к задаче обработки:
+        # без учёта скачиваемых файлов пачка загрузок проскочила бы лимит.
+        workflow_data = dispatcher.workflow_data
+        active_tasks = workflow_data.get('active_processing_tasks')
+        pending = (len(active_tasks) if isinstance(active_tasks, set) else 0) + workflow_data.get('reserved_processing_slots', 0)
+        if MAX_PENDING_TASKS > 0 and pending >= MAX_PENDING_TASKS:
+            logger.warning('Processing queue is full (%d tasks); rejecting file from %s', pending, user_id)
+            if release_throttle is not None:
+                release_throttle()
+            await message.answer(tr('media_queue_full', locale), parse_mode='HTML')
+            return
 
-        _sz = dest.stat().st_size / (1024 * 1024) if dest.exists() else None
-        await edit_status(status_msg, filename=fname, size_mb=_sz, step=0, locale=locale)
-        task = asyncio.create_task(processor.process_file(dest, fname, message, status_msg, locale))
-        active_tasks = dispatcher.workflow_data.get('active_processing_tasks')
+        workflow_data['reserved_processing_slots'] = workflow_data.get('reserved_processing_slots', 0) + 1
+        try:
+            await _download_and_start(file_obj, fname, active_tasks)
+        finally:
+            workflow_data['reserved_processing_slots'] -= 1
+
+    async def _download_and_start(file_obj, fname: str, active_tasks):
+        dest = GIFS_DIR / f'{owner_id}_{ts}_{fname}'
+        # Статус-сообщение и скачивание — независимые запросы к Telegram,
+        # выполняем их параллельно, чтобы не ждать лишний round-trip.
+        # return_exceptions: gather дожидается обоих запросов, даже если один упал,
+        # иначе скачивание продолжилось бы без присмотра и оставило файл в gifs/.
+        status_msg, downloaded = await asyncio.gather(
+            message.answer(tr('media_downloading', locale), parse_mode='HTML'),
+            bot.download(file_obj.file_id, destination=dest, chunk_size=_DOWNLOAD_CHUNK_SIZE),
+            return_exceptions=True,
+        )
+        if isinstance(status_msg, BaseException) or isinstance(downloaded, BaseException):
+            # частично скачанный или уже никому не нужный файл не оставляем на диске
+            dest.unlink(missing_ok=True)
+            if not isinstance(status_msg, BaseException):
+                # ошибку покажет общий обработчик ниже; статус «скачиваю» убираем
+                try:
+                    await status_msg.delete()
+                except Exception:
+                    pass
+            raise downloaded if isinstance(downloaded, BaseException) else status_msg
+        # один stat на загрузку: размер нужен и для лога, и для статус-сообщения
+        size_bytes = dest.stat().st_size
+        logger.info('Downloaded to %s (%d bytes)', dest, size_bytes)
+
+        await edit_status(status_msg, filename=fname, size_mb=size_bytes / (1024 * 1024), step=0, locale=locale)
+        task = asyncio.create_task(
+            processor.process_file(
+                dest, fname, message, status_msg, locale, unique_id=file_obj.file_unique_id,
+            )
+        )
         if isinstance(active_tasks, set):
             active_tasks.add(task)
             task.add_done_callback(active_tasks.discard)
 
     try:
-        if anim:
-            fname = anim.file_name or 'animation.mp4'
-            await _download_and_process(anim, fname)
-            return
-
-        if vid:
-            fname = vid.file_name or 'video.mp4'
-            await _download_and_process(vid, fname)
+        if file_obj is None:
+            await message.answer(
+                tr('media_file_not_found', locale),
+                parse_mode='HTML',
+            )
             return
 
-        if doc:
-            fname = doc.file_name or 'file'
-            mime = (doc.mime_type or '').lower()
-            if fname.lower().endswith(('.gif', '.mp4', '.webm')) or 'gif' in mime or mime.startswith('video'):
-                await _download_and_process(doc, fname)
-                return
-            else:
+        if isinstance(file_obj, types.Document):
+            mime = (file_obj.mime_type or '').lower()
+            if not (fname.lower().endswith(('.gif', '.mp4', '.webm')) or 'gif' in mime or mime.startswith('video')):
                 await message.answer(
                     tr(
                         'media_unsupported_format',
@@ -128,10 +182,7 @@ async def handle_file(message: types.Message, bot: Bot, processor: ProcessingSer
                 )
                 return
 
-        await message.answer(
-            tr('media_file_not_found', locale),
-            parse_mode='HTML',
-        )
+        await _download_and_process(file_obj, fname)
 
     except Exception as e:
         logger.exception('Error while saving file')
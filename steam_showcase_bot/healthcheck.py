@@ -4,6 +4,11 @@ from pathlib import Path
 from .config import HEALTHCHECK_MAX_STALENESS_SECONDS, HEARTBEAT_FILE
 from .ffmpeg_utils import is_ffmpeg_available
 
+# Healthcheck — отдельный процесс, кэш проверки ffmpeg в него не переходит.
+# Проба должна уложиться в timeout healthcheck из docker-compose.yml (5s) вместе
+# с запуском Python, иначе вместо «ffmpeg недоступен» будет просто таймаут.
+_FFMPEG_PROBE_TIMEOUT_SECONDS = 2
+
 
 def main() -> int:
     heartbeat = Path(HEARTBEAT_FILE)
@@ -20,7 +25,7 @@ def main() -> int:
         )
         return 1
 
-    if not is_ffmpeg_available():
+    if not is_ffmpeg_available(timeout=_FFMPEG_PROBE_TIMEOUT_SECONDS):
         print('ffmpeg is not available')
         return 1
 
@@ -83,6 +83,10 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
             "⏳ <b>Бот завершает работу</b>\n\n"
             "Сейчас новые файлы не принимаются. Повтори отправку через минуту."
         ),
+        "media_queue_full": (
+            "⏳ <b>Очередь обработки заполнена</b>\n\n"
+            "Сейчас обрабатывается слишком много файлов. Повтори отправку через пару минут."
+        ),
         "media_file_too_big": (
             "⚠️ <b>Файл слишком большой</b>\n\n"
             "Размер: <code>{size_mb} MB</code> (максимум: <code>{max_mb} MB</code>)\n\n"
@@ -226,6 +230,10 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
             "⏳ <b>Bot is shutting down</b>\n\n"
             "New files are temporarily unavailable. Please try again in a minute."
         ),
+        "media_queue_full": (
+            "⏳ <b>Processing queue is full</b>\n\n"
+            "Too many files are being processed right now. Please try again in a couple of minutes."
+        ),
         "media_file_too_big": (
             "⚠️ <b>File is too large</b>\n\n"
             "Size: <code>{size_mb} MB</code> (max: <code>{max_mb} MB</code>)\n\n"
@@ -370,6 +378,10 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
             "⏳ <b>Бот завершує роботу</b>\n\n"
             "Зараз нові файли тимчасово не приймаються. Спробуй ще раз за хвилину."
         ),
+        "media_queue_full": (
+            "⏳ <b>Черга обробки заповнена</b>\n\n"
+            "Зараз обробляється забагато файлів. Спробуй ще раз за кілька хвилин."
+        ),
         "media_file_too_big": (
             "⚠️ <b>Файл занадто великий</b>\n\n"
             "Розмір: <code>{size_mb} MB</code> (максимум: <code>{max_mb} MB</code>)\n\n"
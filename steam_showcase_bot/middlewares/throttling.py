@@ -15,7 +15,8 @@ class ThrottlingMiddleware(BaseMiddleware):
 
     def __init__(self, rate_limit: float = 30.0):
         self._rate_limit = rate_limit
-        self._user_timestamps: dict[int, float] = {}
+        # user_id -> (время последнего принятого файла, предупреждён ли в этом окне)
+        self._user_timestamps: dict[int, tuple[float, bool]] = {}
 
     async def __call__(
         self,
@@ -26,25 +27,32 @@ class ThrottlingMiddleware(BaseMiddleware):
         user = data.get('event_from_user')
         if user:
             now = asyncio.get_event_loop().time()
-            last = self._user_timestamps.get(user.id, 0.0)
+            last, warned = self._user_timestamps.get(user.id, (0.0, False))
             if now - last < self._rate_limit:
                 remaining = int(self._rate_limit - (now - last)) + 1
                 logger.debug('Throttled user %s: %d sec remaining', user.id, remaining)
-                locale = resolve_locale(None, getattr(user, 'language_code', None))
+                if warned:
+                    # Уже предупреждали в этом окне: при пачке файлов отвечаем один раз,
+                    # а не отдельным сообщением на каждый файл.
+                    return None
+                self._user_timestamps[user.id] = (last, True)
+                locale = resolve_locale(None, user.language_code)
                 dispatcher = data.get('dispatcher')
                 bot = data.get('bot')
                 if dispatcher is not None and bot is not None:
                     locale = await get_user_locale(
                         dispatcher,
                         bot,
-                        getattr(user, 'id', None),
-                        getattr(user, 'language_code', None),
+                        user.id,
+                        user.language_code,
                     )
                 await event.answer(
                     tr('throttling_wait', locale, remaining=remaining),
                     parse_mode='HTML',
                 )
                 return None
-            self._user_timestamps[user.id] = now
+            self._user_timestamps[user.id] = (now, False)
+            # хендлер может вернуть попытку, если файл не принят (например, очередь полна)
+            data['release_throttle'] = lambda user_id=user.id: self._user_timestamps.pop(user_id, None)
 
         return await handler(event, data)
@@ -1,15 +1,24 @@
 import asyncio
 import logging
-import shutil
+from collections import OrderedDict
+from concurrent.futures import Executor
 from pathlib import Path
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramNetworkError
 from aiogram.types import FSInputFile, Message
 
-from ..config import MAX_ARCHIVE_SEND_MB, ZIP_SEND_RETRIES, ZIP_SEND_TIMEOUT
+from ..config import (
+    ARCHIVE_CACHE_SIZE,
+    MAX_ARCHIVE_SEND_MB,
+    PREPARED_DIR,
+    SLICED_DIR,
+    ZIP_SEND_RETRIES,
+    ZIP_SEND_TIMEOUT,
+)
 from ..ffmpeg_utils import (
     is_ffmpeg_available,
+    move_file,
     prepare_and_resize_copy,
     slice_video_inplace_with_gifs,
 )
@@ -27,9 +36,47 @@ logger = logging.getLogger('steam_showcase_bot.processor')
 
 
 class ProcessingService:
-    def __init__(self, bot: Bot, semaphore: asyncio.Semaphore):
+    def __init__(self, bot: Bot, semaphore: asyncio.Semaphore, executor: Executor | None = None):
         self._bot = bot
         self._semaphore = semaphore
+        # отдельный пул под ffmpeg, чтобы долгие задачи не занимали default executor
+        self._executor = executor
+        # file_unique_id исходника -> (file_id отправленного ZIP, размер в MB)
+        self._archive_cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def send_cached_archive(self, unique_id: str | None, message: Message, locale: str) -> bool:
+        """Повторно отправляет уже готовый ZIP по file_id, если исходник встречался раньше.
+
+        Возвращает True, если архив отправлен и скачивание/обработку можно пропустить.
+        """
+        if not unique_id:
+            return False
+        cached = self._archive_cache.get(unique_id)
+        if cached is None:
+            return False
+        self._archive_cache.move_to_end(unique_id)
+        file_id, size_mb = cached
+        try:
+            await message.answer_document(
+                document=file_id,
+                caption=tr('processor_archive_caption', locale, size_mb=f'{size_mb:.1f}'),
+                parse_mode='HTML',
+            )
+        except Exception:
+            logger.exception('Failed to resend cached archive for %s', unique_id)
+            self._archive_cache.pop(unique_id, None)
+            return False
+        logger.info('Resent cached archive for %s', unique_id)
+        return True
+
+    def _remember_archive(self, unique_id: str | None, sent: Message, size_mb: float) -> None:
+        document = sent.document
+        if not unique_id or document is None or ARCHIVE_CACHE_SIZE <= 0:
+            return
+        self._archive_cache[unique_id] = (document.file_id, size_mb)
+        self._archive_cache.move_to_end(unique_id)
+        while len(self._archive_cache) > ARCHIVE_CACHE_SIZE:
+            self._archive_cache.popitem(last=False)
 
     async def process_file(
         self,
@@ -38,13 +85,14 @@ class ProcessingService:
         message: Message,
         status_msg: Message | None,
         locale: str,
+        unique_id: str | None = None,
     ) -> None:
         """Полный цикл: resize -> slice -> GIF -> ZIP -> отправка -> cleanup.
 
         Автоматически захватывает семафор, ограничивая параллельные задачи ffmpeg.
         """
         async with self._semaphore:
-            await self._do_process(src_path, visible_name, message, status_msg, locale)
+            await self._do_process(src_path, visible_name, message, status_msg, locale, unique_id)
 
     async def _do_process(
         self,
@@ -53,8 +101,9 @@ class ProcessingService:
         message: Message,
         status_msg: Message | None,
         locale: str,
+        unique_id: str | None = None,
     ) -> None:
-        user_id = getattr(message.from_user, 'id', 'unknown')
+        user_id = message.from_user.id if message.from_user else 'unknown'
         _sz: float | None = None
         try:
             _sz = src_path.stat().st_size / (1024 * 1024)
@@ -67,7 +116,9 @@ class ProcessingService:
                 step=step, failed_at=failed_at, error_msg=error_msg, locale=locale,
             )
 
-        if not is_ffmpeg_available():
+        loop = asyncio.get_running_loop()
+        # проверка запускает `ffmpeg -version` — не блокируем event loop
+        if not await loop.run_in_executor(None, is_ffmpeg_available):
             logger.warning('ffmpeg executable not found; skipping prepare task')
             await _upd(0, failed_at=STEP_SCALE, error_msg='FFmpeg не найден на сервере')
             self._safe_unlink(src_path)
@@ -97,28 +148,29 @@ class ProcessingService:
                 pass
             return
 
-        prepared_dir = src_path.parent.parent / 'prepared_gifs'
-        loop = asyncio.get_running_loop()
+        prepared_dir = PREPARED_DIR
 
         try:
             await _upd(STEP_SCALE)
-            prepared = await loop.run_in_executor(None, prepare_and_resize_copy, src_path, prepared_dir)
+            prepared, width = await loop.run_in_executor(
+                self._executor, prepare_and_resize_copy, src_path, prepared_dir,
+            )
 
-            sliced_dir = src_path.parent.parent / 'sliced_gifs'
-            sliced_dir.mkdir(exist_ok=True)
+            sliced_dir = SLICED_DIR
             sliced_copy = sliced_dir / prepared.name
-            shutil.copy2(prepared, sliced_copy)
-            logger.info('Copied prepared file to %s for slicing', sliced_copy)
+            await loop.run_in_executor(None, move_file, prepared, sliced_copy)
+            logger.info('Moved prepared file to %s for slicing', sliced_copy)
 
             await _upd(STEP_SLICE)
             try:
-                archive_path = await loop.run_in_executor(None, slice_video_inplace_with_gifs, sliced_copy)
+                archive_path, artifacts = await loop.run_in_executor(
+                    self._executor, slice_video_inplace_with_gifs, sliced_copy, width,
+                )
             except Exception as e:
                 logger.exception('Error while slicing file %s', sliced_copy)
                 await _upd(0, failed_at=STEP_GIFS, error_msg=str(e))
-                for path in (sliced_copy, prepared, src_path):
+                for path in (sliced_copy, src_path):
                     self._safe_unlink(path)
-                self._clean_artifacts(sliced_dir, sliced_copy.stem)
                 try:
                     await message.answer(
                         tr('processor_gif_error', locale, error=esc(str(e)[:300])),
@@ -128,13 +180,11 @@ class ProcessingService:
                     pass
                 return
 
-            for path in (src_path, prepared):
+            for path in (src_path, *artifacts):
                 self._safe_unlink(path)
 
-            self._clean_mp4_artifacts(sliced_dir, sliced_copy.stem)
-
             await _upd(STEP_DONE)
-            await self._send_archive(archive_path, message, user_id, locale)
+            await self._send_archive(archive_path, message, user_id, locale, unique_id)
 
         except Exception as e:
             logger.exception('Error while preparing file %s', src_path)
@@ -149,7 +199,14 @@ class ProcessingService:
             except Exception:
                 pass
 
-    async def _send_archive(self, archive_path, message: Message, user_id, locale: str) -> None:
+    async def _send_archive(
+        self,
+        archive_path,
+        message: Message,
+        user_id,
+        locale: str,
+        unique_id: str | None = None,
+    ) -> None:
         if not archive_path:
             logger.debug('No archive path returned; skipping send')
             return
@@ -181,12 +238,13 @@ class ProcessingService:
             try:
                 fsfile = FSInputFile(str(archive))
                 caption = tr('processor_archive_caption', locale, size_mb=f'{size_mb:.1f}')
-                await message.answer_document(
+                sent_msg = await message.answer_document(
                     document=fsfile,
                     caption=caption,
                     parse_mode='HTML',
                     request_timeout=ZIP_SEND_TIMEOUT,
                 )
+                self._remember_archive(unique_id, sent_msg, size_mb)
                 logger.info(
                     'Sent ZIP %s to user %s (size=%.1f MB) on attempt %d',
                     archive, user_id, size_mb, attempt,
@@ -228,33 +286,3 @@ class ProcessingService:
                 logger.info('Removed %s', path)
         except Exception:
             logger.exception('Failed to remove %s', path)
-
-    @staticmethod
-    def _clean_artifacts(sliced_dir: Path, stem: str) -> None:
-        try:
-            for f in sliced_dir.glob(f'{stem}*'):
-                try:
-                    if f.is_dir():
-                        shutil.rmtree(f)
-                    else:
-                        f.unlink()
-                    logger.info('Removed artifact %s', f)
-                except Exception:
-                    logger.exception('Failed to remove artifact %s', f)
-        except Exception:
-            logger.exception('Error while cleaning artifacts in %s', sliced_dir)
-
-    @staticmethod
-    def _clean_mp4_artifacts(sliced_dir: Path, stem: str) -> None:
-        try:
-            removed = []
-            for mp4 in sliced_dir.glob(f'{stem}*.mp4'):
-                try:
-                    mp4.unlink()
-                    removed.append(mp4.name)
-                except Exception:
-                    logger.exception('Failed to remove intermediate mp4 %s', mp4)
-            if removed:
-                logger.info('Removed intermediate mp4 files: %s', ', '.join(removed))
-        except Exception:
-            logger.exception('Error while cleaning .mp4 files in %s', sliced_dir)
@@ -1,10 +1,17 @@
 import importlib
+import os
 import pkgutil
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import steam_showcase_bot.tests as tests_pkg
 
+# Число потоков для прогона тестов (по умолчанию 1 — последовательно).
+# Модули с SERIAL = True подменяют общие атрибуты (subprocess.Popen,
+# ffmpeg_utils.*, состояние bot/dp) и всегда выполняются по одному, после пула.
+TEST_JOBS = int(os.getenv('TEST_JOBS', '1'))
+
 
 def _iter_test_modules():
     prefix = tests_pkg.__name__ + '.'
@@ -17,18 +24,45 @@ def _iter_test_modules():
                 print(f'SKIP: {module_name} (import error: {exc})')
 
 
-failures = []
+def _run_test(item):
+    """Запускает один тест, возвращает (имя, traceback или None)."""
+    name, fn = item
+    try:
+        fn()
+        return name, None
+    except Exception:
+        return name, traceback.format_exc()
+
+
+tests = []
+serial = set()
 for mod in _iter_test_modules():
     for name in dir(mod):
         if name.startswith('test_'):
-            fn = getattr(mod, name)
-            try:
-                fn()
-                print(f'OK: {mod.__name__}.{name}')
-            except Exception:
-                print(f'FAIL: {mod.__name__}.{name}')
-                traceback.print_exc()
-                failures.append(f'{mod.__name__}.{name}')
+            tests.append((f'{mod.__name__}.{name}', getattr(mod, name)))
+            if getattr(mod, 'SERIAL', False):
+                serial.add(tests[-1][0])
+
+parallel = [item for item in tests if item[0] not in serial] if TEST_JOBS > 1 else []
+results = {}
+if parallel:
+    with ThreadPoolExecutor(max_workers=TEST_JOBS) as pool:
+        results.update(pool.map(_run_test, parallel))
+# SERIAL-модули (и всё остальное при TEST_JOBS=1) — по одному, уже после пула
+for item in tests:
+    if item[0] not in results:
+        name, tb = _run_test(item)
+        results[name] = tb
+
+failures = []
+for name, _ in tests:
+    tb = results[name]
+    if tb is None:
+        print(f'OK: {name}')
+    else:
+        print(f'FAIL: {name}')
+        print(tb, end='', file=sys.stderr)
+        failures.append(name)
 
 if failures:
     print('\nFAILED tests:', failures)
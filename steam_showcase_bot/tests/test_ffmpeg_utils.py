@@ -1,8 +1,12 @@
 import tempfile
+import zipfile
 from pathlib import Path
 
 import steam_showcase_bot.ffmpeg_utils as ffmpeg_utils
 
+# подменяет общие атрибуты модулей: run_tests_no_pytest не запускает параллельно
+SERIAL = True
+
 
 class _DummyPopen:
     def __init__(self, cmd, stdout=None, stderr=None, text=None):
@@ -12,8 +16,8 @@ class _DummyPopen:
         self.stderr = stderr
         self.text = text
         self.returncode = 0
-        self._out = ''
-        self._err = ''
+        self._out = b''
+        self._err = b''
 
     def communicate(self, input=None, timeout=None):
         return self._out, self._err
@@ -41,7 +45,7 @@ class _DummyPopenFail(_DummyPopen):
     def __init__(self, cmd, stdout=None, stderr=None, text=None):
         super().__init__(cmd, stdout=stdout, stderr=stderr, text=text)
         self.returncode = 1
-        self._err = 'ffmpeg failed'
+        self._err = b'ffmpeg failed'
 
 
 def _patch_attr(obj, name, value):
@@ -84,57 +88,299 @@ def test_fix_gif_terminator_empty_file():
 
 
 def test_resize_mp4_to_width_750_success():
-    old_bin = _patch_attr(ffmpeg_utils, 'FFMPEG_BIN', 'ffmpeg')
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
     old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopen)
     try:
         ffmpeg_utils.resize_mp4_to_width_750(Path('in.mp4'), Path('out.mp4'))
     finally:
-        ffmpeg_utils.FFMPEG_BIN = old_bin
+        ffmpeg_utils.ffmpeg_bin = old_bin
         ffmpeg_utils.subprocess.Popen = old_popen
 
 
 def test_resize_mp4_to_width_750_raises_on_ffmpeg_error():
-    old_bin = _patch_attr(ffmpeg_utils, 'FFMPEG_BIN', 'ffmpeg')
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+    old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
     old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopenFail)
     try:
         raised = False
         try:
             ffmpeg_utils.resize_mp4_to_width_750(Path('in.mp4'), Path('out.mp4'))
         except RuntimeError as exc:
-            raised = 'ffmpeg error' in str(exc)
+            raised = 'ffmpeg error' in str(exc) and 'ffmpeg failed' in str(exc)
         assert raised
     finally:
-        ffmpeg_utils.FFMPEG_BIN = old_bin
+        ffmpeg_utils.ffmpeg_bin = old_bin
+        ffmpeg_utils.is_ffmpeg_available = old_available
         ffmpeg_utils.subprocess.Popen = old_popen
 
 
-def test_make_gif_from_video_invokes_terminator_fix():
-    old_bin = _patch_attr(ffmpeg_utils, 'FFMPEG_BIN', 'ffmpeg')
-    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopen)
-    called = {'value': False}
-
-    def _fake_fix(path):
-        called['value'] = True
-        return True
-
-    old_fix = _patch_attr(ffmpeg_utils, '_fix_gif_terminator', _fake_fix)
+def test_ffmpeg_runs_does_not_cache_failed_probe():
+    ffmpeg_utils._working_ffmpeg_bins.clear()
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopenFail)
     try:
-        ffmpeg_utils.make_gif_from_video(Path('in.mp4'), Path('out.gif'))
-        assert called['value'] is True
+        assert ffmpeg_utils._ffmpeg_runs('ffmpeg') is False
+        ffmpeg_utils.subprocess.Popen = _DummyPopen
+        assert ffmpeg_utils._ffmpeg_runs('ffmpeg') is True
+        ffmpeg_utils.subprocess.Popen = _DummyPopenFail
+        assert ffmpeg_utils._ffmpeg_runs('ffmpeg') is True
     finally:
-        ffmpeg_utils.FFMPEG_BIN = old_bin
         ffmpeg_utils.subprocess.Popen = old_popen
-        ffmpeg_utils._fix_gif_terminator = old_fix
+        ffmpeg_utils._working_ffmpeg_bins.clear()
 
 
-def test_make_gif_from_video_raises_when_ffmpeg_missing():
-    old_bin = _patch_attr(ffmpeg_utils, 'FFMPEG_BIN', None)
+def test_slice_video_raises_when_ffmpeg_missing():
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: None)
     try:
         raised = False
         try:
-            ffmpeg_utils.make_gif_from_video(Path('in.mp4'), Path('out.gif'))
+            ffmpeg_utils.slice_video_inplace_with_gifs(Path('in.mp4'), known_width=750)
         except RuntimeError as exc:
             raised = 'ffmpeg не найден' in str(exc)
         assert raised
     finally:
-        ffmpeg_utils.FFMPEG_BIN = old_bin
+        ffmpeg_utils.ffmpeg_bin = old_bin
+
+
+def test_resize_mp4_to_width_750_falls_back_from_failed_hw_encoder():
+    commands = []
+
+    class _PopenHwFails(_DummyPopen):
+        def __init__(self, cmd, **kwargs):
+            super().__init__(cmd, **kwargs)
+            commands.append(cmd)
+            if 'h264_nvenc' in cmd:
+                self.returncode = 1
+                self._err = b'no NVENC capable devices found'
+
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+    old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _PopenHwFails)
+    old_mode = _patch_attr(ffmpeg_utils, 'FFMPEG_HW_ENCODER', 'auto')
+    old_list = _patch_attr(ffmpeg_utils, '_list_ffmpeg_encoders', lambda b: frozenset({'h264_nvenc'}))
+    try:
+        ffmpeg_utils.resize_mp4_to_width_750(Path('in.mp4'), Path('out.mp4'))
+        assert 'h264_nvenc' in commands[0]
+        assert 'libx264' in commands[1]
+        assert '-an' in commands[1] and '-c:a' not in commands[1]
+        assert ffmpeg_utils._detect_hw_encoder() is None
+    finally:
+        ffmpeg_utils.ffmpeg_bin = old_bin
+        ffmpeg_utils.is_ffmpeg_available = old_available
+        ffmpeg_utils.subprocess.Popen = old_popen
+        ffmpeg_utils.FFMPEG_HW_ENCODER = old_mode
+        ffmpeg_utils._list_ffmpeg_encoders = old_list
+        ffmpeg_utils._failed_hw_encoders.clear()
+
+
+def test_resize_keeps_hw_encoder_when_libx264_also_fails():
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+    old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopenFail)
+    old_mode = _patch_attr(ffmpeg_utils, 'FFMPEG_HW_ENCODER', 'auto')
+    old_list = _patch_attr(ffmpeg_utils, '_list_ffmpeg_encoders', lambda b: frozenset({'h264_nvenc'}))
+    try:
+        raised = False
+        try:
+            ffmpeg_utils.resize_mp4_to_width_750(Path('broken.mp4'), Path('out.mp4'))
+        except RuntimeError:
+            raised = True
+        assert raised
+        assert 'h264_nvenc' not in ffmpeg_utils._failed_hw_encoders
+        assert ffmpeg_utils._detect_hw_encoder() == 'h264_nvenc'
+    finally:
+        ffmpeg_utils.ffmpeg_bin = old_bin
+        ffmpeg_utils.is_ffmpeg_available = old_available
+        ffmpeg_utils.subprocess.Popen = old_popen
+        ffmpeg_utils.FFMPEG_HW_ENCODER = old_mode
+        ffmpeg_utils._list_ffmpeg_encoders = old_list
+        ffmpeg_utils._failed_hw_encoders.clear()
+
+
+def test_slice_video_removes_partial_parts_on_failure():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / 'clip.mp4'
+        src.write_bytes(b'video')
+
+        class _PopenWritesThenFails(_DummyPopen):
+            def __init__(self, cmd, **kwargs):
+                super().__init__(cmd, **kwargs)
+                outputs = [arg for arg in cmd if arg.endswith(('.png', '.gif')) and not Path(arg).exists()]
+                for out in outputs:
+                    Path(out).write_bytes(b'data')
+                if any(out.endswith('.gif') for out in outputs):
+                    self.returncode = 1
+                    self._err = b'encoder crashed'
+
+        old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+        old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
+        old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _PopenWritesThenFails)
+        old_probe = _patch_attr(ffmpeg_utils, 'get_width_height', lambda p: (750, 420))
+        try:
+            raised = False
+            try:
+                ffmpeg_utils.slice_video_inplace_with_gifs(src)
+            except RuntimeError:
+                raised = True
+            assert raised
+        finally:
+            ffmpeg_utils.ffmpeg_bin = old_bin
+            ffmpeg_utils.is_ffmpeg_available = old_available
+            ffmpeg_utils.subprocess.Popen = old_popen
+            ffmpeg_utils.get_width_height = old_probe
+
+        assert sorted(f.name for f in Path(tmp).iterdir()) == ['clip.mp4']
+
+
+def test_move_file_falls_back_to_copy_across_devices():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / 'prepared.mp4'
+        dest = Path(tmp) / 'sliced.mp4'
+        src.write_bytes(b'video')
+
+        def _fail_replace(src_path, dst_path):
+            raise OSError('cross-device link')
+
+        old_replace = _patch_attr(ffmpeg_utils.os, 'replace', _fail_replace)
+        try:
+            ffmpeg_utils.move_file(src, dest)
+        finally:
+            ffmpeg_utils.os.replace = old_replace
+
+        assert dest.read_bytes() == b'video'
+        assert not src.exists()
+
+
+def test_threads_per_job_splits_cores_between_processes():
+    old_cpu_count = _patch_attr(ffmpeg_utils.os, 'cpu_count', lambda: 16)
+    try:
+        assert ffmpeg_utils._threads_per_job(1) == 16
+        assert ffmpeg_utils._threads_per_job(5) == 3
+        assert ffmpeg_utils._threads_per_job(32) == 1
+    finally:
+        ffmpeg_utils.os.cpu_count = old_cpu_count
+
+
+def test_run_ffmpeg_command_keeps_only_stderr_tail():
+    class _PopenNoisyFail(_DummyPopen):
+        def __init__(self, cmd, **kwargs):
+            super().__init__(cmd, **kwargs)
+            self.returncode = 1
+            self._err = '\n'.join(f'line {i}' for i in range(100)).encode()
+
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _PopenNoisyFail)
+    try:
+        message = ''
+        try:
+            ffmpeg_utils._run_ffmpeg_command(['ffmpeg'])
+        except RuntimeError as exc:
+            message = str(exc)
+        assert 'line 99' in message
+        assert 'line 0\n' not in message
+    finally:
+        ffmpeg_utils.subprocess.Popen = old_popen
+
+
+def test_slice_video_encodes_all_gifs_from_one_decode():
+    commands = []
+
+    class _PopenWritesOutputs(_DummyPopen):
+        def __init__(self, cmd, **kwargs):
+            super().__init__(cmd, **kwargs)
+            commands.append(cmd)
+            for arg in cmd:
+                if arg.endswith(('.png', '.gif')) and not Path(arg).exists():
+                    Path(arg).write_bytes(b'GIF89aDATA\x3B')
+
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+    old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _PopenWritesOutputs)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'clip.mp4'
+            src.write_bytes(b'video')
+
+            archive, artifacts = ffmpeg_utils.slice_video_inplace_with_gifs(src, known_width=750)
+
+            assert artifacts == [src]
+            assert sorted(f.name for f in Path(tmp).iterdir()) == ['clip.mp4', 'clip_gifs.zip']
+            with zipfile.ZipFile(archive) as zf:
+                assert zf.namelist() == [f'part{i}.gif' for i in range(1, 6)]
+                assert zf.read('part1.gif')[-1:] == b'\x21'
+        assert len(commands) == 2
+        gif_cmd = commands[1]
+        assert gif_cmd.count('-i') == 2
+        assert sum(arg.endswith('.gif') for arg in gif_cmd) == 5
+        assert not any(arg.endswith('.mp4') for arg in gif_cmd if arg != str(src))
+        assert 'libx264' not in gif_cmd
+        assert '-filter_complex_threads' in gif_cmd
+        assert '-filter_threads' in commands[0] and '-filter_threads' not in gif_cmd
+    finally:
+        ffmpeg_utils.ffmpeg_bin = old_bin
+        ffmpeg_utils.is_ffmpeg_available = old_available
+        ffmpeg_utils.subprocess.Popen = old_popen
+
+
+def test_slice_video_skips_probe_when_width_is_known():
+    def _probe_must_not_run(path):
+        raise AssertionError('ffprobe should not be called')
+
+    old_bin = _patch_attr(ffmpeg_utils, 'ffmpeg_bin', lambda: 'ffmpeg')
+    old_available = _patch_attr(ffmpeg_utils, 'is_ffmpeg_available', lambda: True)
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopenFail)
+    old_probe = _patch_attr(ffmpeg_utils, 'get_width_height', _probe_must_not_run)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            raised = False
+            try:
+                ffmpeg_utils.slice_video_inplace_with_gifs(Path(tmp) / 'clip.mp4', known_width=750)
+            except RuntimeError as exc:
+                raised = 'ffmpeg error' in str(exc)
+            assert raised
+    finally:
+        ffmpeg_utils.ffmpeg_bin = old_bin
+        ffmpeg_utils.is_ffmpeg_available = old_available
+        ffmpeg_utils.subprocess.Popen = old_popen
+        ffmpeg_utils.get_width_height = old_probe
+
+
+def test_get_width_height_parses_csv_output():
+    class _ProbePopen(_DummyPopen):
+        def __init__(self, cmd, stdout=None, stderr=None, text=None):
+            super().__init__(cmd, stdout=stdout, stderr=stderr, text=text)
+            self._out = b'750,420\n'
+
+    old_probe_bin = _patch_attr(ffmpeg_utils, 'ffprobe_bin', lambda: 'ffprobe')
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _ProbePopen)
+    try:
+        assert ffmpeg_utils.get_width_height(Path('clip.mp4')) == (750, 420)
+    finally:
+        ffmpeg_utils.subprocess.Popen = old_popen
+        ffmpeg_utils.ffprobe_bin = old_probe_bin
+
+
+def test_prefetch_input_ignores_missing_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'clip.mp4'
+        ffmpeg_utils._prefetch_input(path)
+        path.write_bytes(b'video')
+        ffmpeg_utils._prefetch_input(path)
+        assert path.read_bytes() == b'video'
+
+
+def test_list_ffmpeg_encoders_does_not_cache_failed_probe():
+    class _EncodersPopen(_DummyPopen):
+        def __init__(self, cmd, **kwargs):
+            super().__init__(cmd, **kwargs)
+            self._out = ' V....D h264_nvenc           NVIDIA NVENC H.264 encoder\n'
+
+    ffmpeg_utils._ffmpeg_encoders.clear()
+    old_popen = _patch_attr(ffmpeg_utils.subprocess, 'Popen', _DummyPopenFail)
+    try:
+        assert ffmpeg_utils._list_ffmpeg_encoders('ffmpeg') == frozenset()
+        ffmpeg_utils.subprocess.Popen = _EncodersPopen
+        assert ffmpeg_utils._list_ffmpeg_encoders('ffmpeg') == frozenset({'h264_nvenc'})
+        ffmpeg_utils.subprocess.Popen = _DummyPopenFail
+        assert ffmpeg_utils._list_ffmpeg_encoders('ffmpeg') == frozenset({'h264_nvenc'})
+    finally:
+        ffmpeg_utils.subprocess.Popen = old_popen
+        ffmpeg_utils._ffmpeg_encoders.clear()
@@ -0,0 +1,133 @@
+import asyncio
+import tempfile
+from pathlib import Path
+
+import steam_showcase_bot.handlers.media as media
+
+# подменяет общие атрибуты модулей: run_tests_no_pytest не запускает параллельно
+SERIAL = True
+
+
+def _patch_attr(obj, name, value):
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    return old
+
+
+class _DummyVideo:
+    file_name = 'clip.mp4'
+    file_size = 1024
+    file_id = 'file-id'
+    file_unique_id = 'uniq'
+
+
+class _DummyStatus:
+    async def delete(self):
+        pass
+
+
+class _DummyMessage:
+    message_id = 1
+    from_user = None
+    animation = None
+    document = None
+
+    def __init__(self):
+        self.video = _DummyVideo()
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+        return _DummyStatus()
+
+
+class _DummyDispatcher:
+    def __init__(self):
+        self.workflow_data = {'active_processing_tasks': set(), 'reserved_processing_slots': 0}
+
+
+class _DummyProcessor:
+    def __init__(self):
+        self.processed = []
+
+    async def send_cached_archive(self, unique_id, message, locale):
+        return False
+
+    async def process_file(self, path, *args, **kwargs):
+        self.processed.append(path)
+
+
+class _BlockingBot:
+    """bot.download, который ждёт сигнала и либо пишет файл, либо падает."""
+
+    def __init__(self, fail=False):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.fail = fail
+
+    async def download(self, file_id, destination, chunk_size):
+        Path(destination).write_bytes(b'partial')
+        self.started.set()
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError('download failed')
+
+
+def _run_two_uploads(fail_first_download):
+    dispatcher = _DummyDispatcher()
+    processor = _DummyProcessor()
+    bot = _BlockingBot(fail=fail_first_download)
+    first, second = _DummyMessage(), _DummyMessage()
+    released = []
+    observed = {}
+
+    async def _get_locale(*args, **kwargs):
+        return 'en'
+
+    async def _edit_status(*args, **kwargs):
+        pass
+
+    async def _run():
+        task = asyncio.create_task(media.handle_file(first, bot, processor, dispatcher))
+        await bot.started.wait()
+        observed['reserved_during_download'] = dispatcher.workflow_data['reserved_processing_slots']
+        await media.handle_file(second, bot, processor, dispatcher, release_throttle=lambda: released.append(True))
+        bot.release.set()
+        await task
+        await asyncio.sleep(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_dir = _patch_attr(media, 'GIFS_DIR', Path(tmp))
+        old_limit = _patch_attr(media, 'MAX_PENDING_TASKS', 1)
+        old_locale = _patch_attr(media, 'get_user_locale', _get_locale)
+        old_edit = _patch_attr(media, 'edit_status', _edit_status)
+        try:
+            asyncio.run(_run())
+            observed['files'] = [f.name for f in Path(tmp).iterdir()]
+        finally:
+            media.GIFS_DIR = old_dir
+            media.MAX_PENDING_TASKS = old_limit
+            media.get_user_locale = old_locale
+            media.edit_status = old_edit
+
+    return dispatcher, processor, first, second, released, observed
+
+
+def test_handle_file_rejects_upload_while_slot_is_reserved_by_download():
+    dispatcher, processor, first, second, released, observed = _run_two_uploads(fail_first_download=False)
+
+    assert observed['reserved_during_download'] == 1
+    assert released == [True]
+    assert len(second.answers) == 1
+    assert 'queue' in second.answers[0].lower()
+    assert dispatcher.workflow_data['reserved_processing_slots'] == 0
+    assert len(processor.processed) == 1
+
+
+def test_handle_file_releases_slot_when_download_fails():
+    dispatcher, processor, first, second, released, observed = _run_two_uploads(fail_first_download=True)
+
+    assert released == [True]
+    assert dispatcher.workflow_data['reserved_processing_slots'] == 0
+    assert processor.processed == []
+    assert observed['files'] == []
@@ -0,0 +1,43 @@
+import asyncio
+
+from steam_showcase_bot.services.processor import ProcessingService
+
+
+class _DummyDocument:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class _DummySent:
+    def __init__(self, file_id):
+        self.document = _DummyDocument(file_id)
+
+
+class _DummyMessage:
+    def __init__(self):
+        self.documents = []
+
+    async def answer_document(self, document, **kwargs):
+        self.documents.append(document)
+        return _DummySent(document)
+
+
+def test_send_cached_archive_misses_unknown_file():
+    service = ProcessingService(bot=None, semaphore=None)
+    message = _DummyMessage()
+
+    sent = asyncio.run(service.send_cached_archive('uniq', message, 'ru'))
+
+    assert sent is False
+    assert message.documents == []
+
+
+def test_send_cached_archive_resends_remembered_file_id():
+    service = ProcessingService(bot=None, semaphore=None)
+    service._remember_archive('uniq', _DummySent('zip-file-id'), 1.5)
+    message = _DummyMessage()
+
+    sent = asyncio.run(service.send_cached_archive('uniq', message, 'ru'))
+
+    assert sent is True
+    assert message.documents == ['zip-file-id']
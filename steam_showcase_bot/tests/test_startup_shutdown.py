@@ -5,6 +5,9 @@ from aiogram import Bot
 
 import steam_showcase_bot.bot as botmod
 
+# подменяет общие атрибуты модулей: run_tests_no_pytest не запускает параллельно
+SERIAL = True
+
 
 def test_import_does_not_crash():
     """Импорт модуля не должен вызывать RuntimeError 'no running event loop'."""
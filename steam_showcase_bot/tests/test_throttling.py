@@ -0,0 +1,53 @@
+import asyncio
+
+from steam_showcase_bot.middlewares.throttling import ThrottlingMiddleware
+
+
+class _DummyUser:
+    id = 42
+    language_code = 'ru'
+
+
+class _DummyMessage:
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+def test_throttling_warns_once_per_window():
+    middleware = ThrottlingMiddleware(rate_limit=60.0)
+    message = _DummyMessage()
+    handled = []
+
+    async def _handler(event, data):
+        handled.append(event)
+
+    async def _run():
+        for _ in range(5):
+            await middleware(_handler, message, {'event_from_user': _DummyUser()})
+
+    asyncio.run(_run())
+
+    assert len(handled) == 1
+    assert len(message.answers) == 1
+
+
+def test_throttling_release_lets_user_retry_immediately():
+    middleware = ThrottlingMiddleware(rate_limit=60.0)
+    message = _DummyMessage()
+    handled = []
+
+    async def _rejecting_handler(event, data):
+        handled.append(event)
+        data['release_throttle']()
+
+    async def _run():
+        for _ in range(2):
+            await middleware(_rejecting_handler, message, {'event_from_user': _DummyUser()})
+
+    asyncio.run(_run())
+
+    assert len(handled) == 2
+    assert message.answers == []